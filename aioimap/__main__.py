@@ -1,7 +1,11 @@
 from .api import get_api
+from .receiver import FETCH_FULL, FETCH_HEADER
 import logging
 import os
+import tempfile
+from typing import List, Union
 import uvicorn
+from uvicorn.importer import import_from_string
 
 
 try:
@@ -12,6 +16,20 @@ try:
 except:
     pass
 
+try:
+    # Run uvicorn on the libuv-based event loop if available
+    import uvloop  # noqa: F401
+    LOOP = "uvloop"
+except ImportError:
+    LOOP = "asyncio"
+
+try:
+    # Parse HTTP requests with the C-based httptools parser if available
+    import httptools  # noqa: F401
+    HTTP = "httptools"
+except ImportError:
+    HTTP = "h11"
+
 
 def default_callable(m):
     from .receiver import RECEIVER_STOPPED
@@ -24,24 +42,84 @@ def default_callable(m):
         logging.debug(f"Content: {m.content}")
 
 
+def worker_api():
+    """
+    Create the API inside a uvicorn worker process from the
+    configuration handed over by `main` through the environment.
+    """
+    logging.basicConfig(
+        level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO"), logging.INFO))
+    return get_api(
+        os.environ.get("SERVER", None),
+        os.environ.get("EMAIL", None),
+        os.environ.get("PASS", None),
+        import_from_string(os.environ["CALLBACK"]),
+        os.environ.get("MAILBOX", "INBOX").split("\n"),
+        receiver_lock=os.environ["RECEIVER_LOCK"],
+        fetch_spec=os.environ.get("FETCH_SPEC", FETCH_FULL))
+
+
 def main(
     host: str = os.environ.get("SERVER", None),
     user: str = os.environ.get("EMAIL", None),
     password: str = os.environ.get("PASS", None),
     callback: callable = default_callable,
-    mailbox: str = "INBOX",
+    mailbox: Union[str, List[str]] = "INBOX",
     log_level: str = "INFO",
     port: int = os.environ.get("PORT", 8080),
+    workers: int = 1,
+    access_log: bool = False,
+    headers_only: bool = False,
 ):
     logging.basicConfig(
         level=getattr(logging, log_level, logging.INFO))
-    api = get_api(host, user, password, callback, mailbox)
-    uvicorn.run(api, host="0.0.0.0", port=port)
+
+    # uvicorn's own logging is kept to warnings and above; the
+    # log level only applies to the receiver
+    server_options = dict(
+        host="0.0.0.0", port=port, loop=LOOP, http=HTTP,
+        access_log=access_log, log_level="warning")
+    fetch_spec = FETCH_HEADER if headers_only else FETCH_FULL
+
+    if workers > 1:
+        # uvicorn can only spawn workers from an import string, so
+        # the configuration is passed on through the environment.
+        # Only the worker holding the lock file runs the receiver.
+        if not isinstance(callback, str):
+            raise ValueError(
+                "`callback` must be an import string in format"
+                " \"<module>:<attribute>\" when `workers` > 1.")
+        # the workers import this module as `aioimap.__main__`,
+        # while `__main__` is their own entry point
+        if callback.startswith("__main__:"):
+            callback = "aioimap." + callback
+        env = {
+            "SERVER": host,
+            "EMAIL": user,
+            "PASS": password,
+            "CALLBACK": callback,
+            # mailbox names cannot contain line breaks
+            "MAILBOX": mailbox if isinstance(mailbox, str) else "\n".join(mailbox),
+            "LOG_LEVEL": log_level,
+            "FETCH_SPEC": fetch_spec,
+            "RECEIVER_LOCK": os.path.join(
+                tempfile.gettempdir(), f"aioimap-{port}.lock"),
+        }
+        os.environ.update({k: v for k, v in env.items() if v is not None})
+        uvicorn.run(
+            "aioimap.__main__:worker_api", factory=True, workers=workers,
+            **server_options)
+
+    else:
+        if isinstance(callback, str):
+            callback = import_from_string(callback)
+        api = get_api(
+            host, user, password, callback, mailbox, fetch_spec=fetch_spec)
+        uvicorn.run(api, **server_options)
 
 
 if __name__ == "__main__":
     import argparse
-    from uvicorn.importer import import_from_string
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -56,26 +134,49 @@ if __name__ == "__main__":
         "-p", "--pwd", default=os.environ.get("PASS", None),
         help='Email ID password')
     parser.add_argument(
-        "-a", "--app", default="__main__:default_callable",
+        "-a", "--app", default="aioimap.__main__:default_callable",
         help=(
             '"app" must be a string in format "<module>:<attribute>"'
             ' where attribute must be a callable. This will be used'
             ' as the callback function when new e-mails are received.'))
     parser.add_argument(
-        "-m", "--mailbox", default="INBOX",
-        help="Name of the mailbox to monitor, default='Inbox'")
+        "-m", "--mailbox", default=["INBOX"], nargs="+",
+        help=(
+            "Name of the mailbox to monitor, default='Inbox'. Further"
+            " mailboxes are watched over the same connection if the"
+            " server supports NOTIFY"))
     parser.add_argument(
         "-l", "--log_level", default="INFO", help='Log level',
         choices=["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"])
     parser.add_argument("--port", default=8080, type=int, help='Port number')
+    parser.add_argument(
+        "-w", "--workers", default=1, type=int,
+        help=(
+            'Number of API worker processes. Only one of them'
+            ' connects to the IMAP server.'))
+    parser.add_argument(
+        "--access-log", dest="access_log", action="store_true",
+        help='Log every HTTP request')
+    parser.add_argument(
+        "--no-access-log", dest="access_log", action="store_false",
+        help='Do not log HTTP requests (default)')
+    parser.set_defaults(access_log=False)
+    parser.add_argument(
+        "--headers-only", action="store_true",
+        help=(
+            'Only download the message headers. The callback'
+            ' will not have access to the message content.'))
     args = parser.parse_args()
 
     main(
         host=args.host,
         user=args.user,
         password=args.pwd,
-        callback=import_from_string(args.app),
+        callback=args.app,
         mailbox=args.mailbox,
         log_level=args.log_level,
         port=args.port,
+        workers=args.workers,
+        access_log=args.access_log,
+        headers_only=args.headers_only,
     )
@@ -1,82 +1,127 @@
-from .receiver import Receiver
+from .receiver import FETCH_FULL, Receiver
 import asyncio
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 import logging
+from typing import List, Union
 
 
 def translate_py_exc_to_http(e):
     t = type(e).__name__
     if t == "ValueError":
         return 422
+    elif t == "TimeoutError":
+        return 504
     else:
         return 500
 
 
+def acquire_receiver_lock(path: str):
+    """
+    Try to take an exclusive lock on the file at `path`. Returns
+    the open lock file if successful, else None.
+    """
+    f = open(path, "a")
+    try:
+        try:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except ImportError:
+            # Windows
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
 def get_api(
     host: str,
     user: str,
     password: str,
     callback: callable,
-    mailbox: str = "INBOX",
+    mailbox: Union[str, List[str]] = "INBOX",
+    receiver_lock: str = None,
+    fetch_spec: str = FETCH_FULL,
 ):
-    if not (
-        isinstance(host, str)
-        and isinstance(user, str)
-        and isinstance(password, str)
-    ):
-        raise ValueError(
-            "`host`, `user`, `password` must be string type."
-            f" Found {(type(host), type(user), type(password))}"
-            " respectively.")
+    for name, value in (("host", host), ("user", user), ("password", password)):
+        if not isinstance(value, str):
+            raise ValueError(
+                f"`{name}` must be string type. Found type {type(value)}")
     if not callable(callback):
         raise ValueError(
             "`callback` must be a callable object."
             f" Found type {type(callback)}")
 
-    api = FastAPI()
-    receiver = None
-
-    @api.on_event("startup")
-    async def on_startup():
-        nonlocal receiver
-        receiver = Receiver()
-        asyncio.ensure_future(
-            receiver.run(
-                host,
-                user,
-                password,
-                callback=callback,
-                mailbox=mailbox,
-                install_signal_handlers=False))
-
-    @api.on_event("shutdown")
-    async def on_shutdown():
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        app.state.receiver = None
+        app.state.receiver_task = None
+        lock = None
+        if receiver_lock is not None:
+            # with multiple workers, only one of them may
+            # run the receiver
+            lock = acquire_receiver_lock(receiver_lock)
+            if lock is None:
+                logging.info("Receiver is run by another worker")
+
+        if receiver_lock is None or lock is not None:
+            receiver = app.state.receiver = Receiver()
+            app.state.receiver_task = asyncio.create_task(
+                receiver.run(
+                    host,
+                    user,
+                    password,
+                    callback=callback,
+                    mailbox=mailbox,
+                    install_signal_handlers=False,
+                    fetch_spec=fetch_spec))
+
+        yield
+
         try:
-            if not receiver.exit_event.is_set():
-                receiver.handle_exit(None, None)
-                await receiver.exit_event.wait()
-        except:
-            import traceback
-            logging.error(traceback.format_exc())
+            task = app.state.receiver_task
+            if task is not None:
+                if app.state.receiver.should_exit is None:
+                    # not started yet, so there is nothing to log out
+                    task.cancel()
+                else:
+                    # ask the receiver to stop instead of cancelling
+                    # the task outright so that it still logs out
+                    app.state.receiver.handle_exit(None, None)
+                await asyncio.gather(task, return_exceptions=True)
+        except Exception:
+            logging.exception("Stopping the receiver failed")
+        finally:
+            if lock is not None:
+                lock.close()
+
+    api = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
     @api.get("/")
-    def read_root():
+    def read_root(request: Request):
+        receiver = request.app.state.receiver
         try:
-            if receiver.exit_event.is_set():
+            if receiver is None:
+                return {"message": "Receiver running in another worker."}
+            elif receiver.exit_event is None or receiver.exit_event.is_set():
                 return {"message": "Receiver not running."}
             else:
                 return {"message": "Receiver running."}
 
-        except:
-            import traceback
-            logging.error(traceback.format_exc())
+        except Exception:
+            logging.exception("Reading the receiver status failed")
 
     @api.get("/change-mailbox")
-    async def change_mailbox(mailbox: str):
+    async def change_mailbox(request: Request, mailbox: str):
+        receiver = request.app.state.receiver
         try:
             if (
-                hasattr(receiver, "imap_client")
+                receiver is not None
                 and receiver.imap_client is not None
+                and receiver.exit_event is not None
                 and not receiver.exit_event.is_set()
                 and not receiver.should_exit.is_set()
             ):
@@ -1,6 +1,14 @@
 from .message import Message
 from abc import ABCMeta, abstractmethod
-from typing import List
+import re
+from typing import Iterable, List
+
+try:
+    # Use an Aho-Corasick automaton for matching many
+    # substrings at once if available
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 
 class Filter(metaclass=ABCMeta):
@@ -10,37 +18,169 @@ class Filter(metaclass=ABCMeta):
         raise NotImplementedError
 
 
-class SenderFilter(Filter):
+def _predicate(f: Filter):
+    # built-in filters pre-compile their check into a plain
+    # function; any other filter, including subclasses that
+    # override __call__, is called as is
+    if type(f).__call__ in _COMPILED_CALLS:
+        return f._pred
+    return f
+
+
+def _substring_matcher(needles: List[str]):
+    """
+    Get a function that checks whether any of the `needles`
+    occurs in a string, using a single pass over the string.
+    """
+    if "" in needles:
+        return lambda text: True
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for needle in needles:
+            automaton.add_word(needle, needle)
+        automaton.make_automaton()
+        return lambda text: next(automaton.iter(text), None) is not None
 
-    def __init__(self, sender: str = None):
-        self.sender = sender
+    return re.compile("|".join(map(re.escape, needles))).search
+
+
+class SenderFilter(Filter):
+    """
+    Match messages whose sender contains `sender`. The check is
+    compiled at construction, so `sender` and `case_insensitive`
+    are read-only.
+    """
+
+    def __init__(self, sender: str = None, case_insensitive: bool = False):
+        self._sender = sender
+        self._case_insensitive = case_insensitive
+        if case_insensitive:
+            self._needle = sender.casefold()
+            self._pred = lambda m, s=self._needle: s in m.sender_ci
+        else:
+            self._needle = sender
+            self._pred = lambda m, s=sender: s in m.sender
+
+    @property
+    def sender(self):
+        return self._sender
+
+    @property
+    def case_insensitive(self):
+        return self._case_insensitive
 
     def __call__(self, msg: Message):
-        return self.sender in msg.sender
+        return self._pred(msg)
 
 
 class SubjectFilter(Filter):
-
-    def __init__(self, subject: str = None):
-        self.subject = subject
+    """
+    Match messages whose subject contains `subject`. The check is
+    compiled at construction, so `subject` and `case_insensitive`
+    are read-only.
+    """
+
+    def __init__(self, subject: str = None, case_insensitive: bool = False):
+        self._subject = subject
+        self._case_insensitive = case_insensitive
+        if case_insensitive:
+            self._needle = subject.casefold()
+            self._pred = lambda m, s=self._needle: s in m.subject_ci
+        else:
+            self._needle = subject
+            self._pred = lambda m, s=subject: s in m.subject
+
+    @property
+    def subject(self):
+        return self._subject
+
+    @property
+    def case_insensitive(self):
+        return self._case_insensitive
 
     def __call__(self, msg: Message):
-        return self.subject in msg.subject
+        return self._pred(msg)
 
 
 class AndFilter(Filter):
+    """
+    Match messages that match all of the `filters`. The check is
+    compiled at construction, so `filters` is a read-only tuple.
+    """
 
     def __init__(self, filters: List[Filter] = None):
-        self.filters = filters
+        self._filters = tuple(filters or ())
+        preds = tuple(_predicate(f) for f in self._filters)
+        self._pred = lambda m, preds=preds: all(p(m) for p in preds)
+
+    @property
+    def filters(self):
+        return self._filters
 
     def __call__(self, msg: Message):
-        return all(f(msg) for f in self.filters)
+        return self._pred(msg)
 
 
 class OrFilter(Filter):
+    """
+    Match messages that match any of the `filters`. The check is
+    compiled at construction, so `filters` is a read-only tuple.
+    """
 
     def __init__(self, filters: List[Filter] = None):
-        self.filters = filters
+        self._filters = filters = tuple(filters or ())
+        types = set(type(f) for f in filters)
+
+        # fold many sender or subject filters into a single
+        # substring search
+        if (
+            len(filters) > 1
+            and (types == {SenderFilter} or types == {SubjectFilter})
+            and len(set(f.case_insensitive for f in filters)) == 1
+        ):
+            attr = "sender" if types == {SenderFilter} else "subject"
+            if filters[0].case_insensitive:
+                attr += "_ci"
+            needles = [f._needle for f in filters]
+            if all(isinstance(n, str) for n in needles):
+                match = _substring_matcher(needles)
+                self._pred = lambda m: bool(match(getattr(m, attr)))
+                return
+
+        preds = tuple(_predicate(f) for f in filters)
+        self._pred = lambda m, preds=preds: any(p(m) for p in preds)
+
+    @property
+    def filters(self):
+        return self._filters
 
     def __call__(self, msg: Message):
-        return any(f(msg) for f in self.filters)
+        return self._pred(msg)
+
+    @classmethod
+    def from_sender_substrings(
+        cls, needles: Iterable[str], case_insensitive: bool = False,
+    ):
+        """
+        Match messages whose sender contains any of the `needles`.
+        """
+        return cls([SenderFilter(n, case_insensitive) for n in needles])
+
+    @classmethod
+    def from_subject_substrings(
+        cls, needles: Iterable[str], case_insensitive: bool = False,
+    ):
+        """
+        Match messages whose subject contains any of the `needles`.
+        """
+        return cls([SubjectFilter(n, case_insensitive) for n in needles])
+
+
+# the __call__ of the built-in filters, which only runs `_pred`
+_COMPILED_CALLS = frozenset((
+    SenderFilter.__call__,
+    SubjectFilter.__call__,
+    AndFilter.__call__,
+    OrFilter.__call__,
+))
@@ -1,46 +1,79 @@
-import email
 from email.header import decode_header
+from email.parser import BytesParser
+from email.policy import compat32
+from functools import cached_property
 
 
 class Message(object):
 
-    def __init__(self, msg):
-        self.msg = email.message_from_bytes(msg)
+    def __init__(self, msg, mailbox=None):
+        self._raw = msg
+        # name of the mailbox the message was received in
+        self.mailbox = mailbox
+        # only parse the headers up front; the body is parsed on
+        # first access to `msg`
+        self._hdr = BytesParser(policy=compat32).parsebytes(
+            msg, headersonly=True)
 
-    @property
+    @cached_property
+    def msg(self):
+        """Get the fully parsed email"""
+        return BytesParser(policy=compat32).parsebytes(self._raw)
+
+    @cached_property
     def subject(self):
         """Get email subject"""
-        subject, encoding = decode_header(self.msg["Subject"])[0]
+        subject, encoding = decode_header(self._hdr["Subject"])[0]
         if isinstance(subject, bytes):
             encoding = 'utf-8' if encoding is None else encoding
             subject = subject.decode(encoding)
         return subject
 
-    @property
+    @cached_property
     def sender(self):
         """Get sender"""
-        sender, encoding = decode_header(self.msg["From"])[0]
+        sender, encoding = decode_header(self._hdr["From"])[0]
         if isinstance(sender, bytes):
             encoding = 'utf-8' if encoding is None else encoding
             sender = sender.decode(encoding)
         return sender
 
-    @property
-    def content(self):
-        # https://humberto.io/blog/sending-and-receiving-emails-with-python/
-        if self.msg.is_multipart():
-            mail_content = ''
+    @cached_property
+    def subject_ci(self):
+        """Get email subject for case-insensitive matching"""
+        return self.subject.casefold()
+
+    @cached_property
+    def sender_ci(self):
+        """Get sender for case-insensitive matching"""
+        return self.sender.casefold()
 
+    def iter_content(self, first_only: bool = False):
+        """
+        Iterate over the decoded text/plain parts of the email,
+        stopping after the first one if `first_only` is set.
+        """
+        if self.msg.is_multipart():
             # on multipart we have the text message and
             # another things like annex, and html version
-            # of the message, in that case we loop through
-            # the email payload
-            mail_content = " ".join(
-                part.get_payload()
-                for part in self.msg.get_payload()
-                if part.get_content_type() == 'text/plain')
+            # of the message, in that case we only decode
+            # the text parts as we walk the message
+            parts = (
+                part for part in self.msg.walk()
+                if part.get_content_type() == 'text/plain'
+                and part.get_content_disposition() != 'attachment')
         else:
             # if the message isn't multipart, just extract it
-            mail_content = self.msg.get_payload()
+            parts = (self.msg,)
+
+        for part in parts:
+            payload = part.get_payload(decode=True) or b''
+            yield payload.decode(
+                part.get_content_charset() or 'utf-8', errors='replace')
+            if first_only:
+                break
 
-        return mail_content
+    @cached_property
+    def content(self):
+        # https://humberto.io/blog/sending-and-receiving-emails-with-python/
+        return " ".join(self.iter_content())
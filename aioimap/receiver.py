@@ -2,12 +2,15 @@ from .message import Message
 from aioimaplib import aioimaplib
 import asyncio
 from asyncio import CancelledError, TimeoutError
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor, ThreadPoolExecutor
 import logging
+import random
+import re
 import signal
-# import ssl
+import ssl
 import threading
-import traceback
-from typing import Any, Callable
+from typing import Any, Awaitable, Callable, List, Union
 
 
 HANDLED_SIGNALS = (
@@ -15,14 +18,405 @@ HANDLED_SIGNALS = (
     signal.SIGTERM,  # Unix signal 15. Sent by `kill <pid>`.
 )
 RECEIVER_STOPPED = "RECEIVER_STOPPED"
+# IDLE is restarted after this many seconds; RFC 2177 allows up
+# to 29 minutes, but some servers (e.g. Gmail) drop idle
+# connections after about 10 minutes
+IDLE_TIMEOUT = 9 * 60
+# FETCH data items for downloading the full message or only its
+# header; both mark the message as seen
+FETCH_FULL = "(RFC822)"
+FETCH_HEADER = "(BODY[HEADER])"
+# maximum number of messages requested by a single FETCH command
+FETCH_BATCH_SIZE = 50
+# messages are parsed in a thread pool, which also runs
+# synchronous callbacks; at most this many callbacks may be
+# waiting or running at once
+CALLBACK_WORKERS = 4
+MAX_PENDING_CALLBACKS = 64
+# messages larger than this many bytes are handed to the
+# receiver's heavy executor, if it has one
+HEAVY_MESSAGE_SIZE = 64 * 1024
+# NOOP is sent on otherwise unused pooled connections after this
+# many seconds so the server does not drop them
+KEEPALIVE_INTERVAL = 5 * 60
+# maximum number of seconds to wait for a mailbox to be selected
+SELECT_TIMEOUT = 5
+# maximum number of seconds to wait for the server to complete
+# IDLE after DONE
+IDLE_DONE_TIMEOUT = 10
+# failed reconnects are retried after a delay that starts at
+# this many seconds and doubles, with some jitter, up to the
+# maximum
+RECONNECT_DELAY = 1
+RECONNECT_MAX_DELAY = 30
+# untagged EXISTS responses in an IDLE push, with the "* " already
+# stripped by aioimaplib and the lines joined by newlines
+_EXISTS_RE = re.compile(rb"^\d+ EXISTS$", re.MULTILINE)
+# events reported by NOTIFY for the watched mailboxes; for
+# mailboxes other than the selected one they are STATUS responses,
+# e.g. b'STATUS "Other box" (MESSAGES 5 UIDNEXT 9)'
+NOTIFY_EVENTS = "(MessageNew MessageExpunge)"
+_STATUS_RE = re.compile(rb'STATUS ("(?:[^"\\]|\\.)*"|[^ ]+) \(')
+# after the first new message is reported, wait this many seconds
+# for further pushes so a burst is fetched at once
+PUSH_DEBOUNCE = 0.05
+# the SELECT response reports the UID the next message will get,
+# FETCH responses the UID of each message
+_UIDNEXT_RE = re.compile(rb"\[UIDNEXT (\d+)\]")
+_UID_RE = re.compile(rb"UID (\d+)")
+
+# aioimaplib does not know the NOTIFY command (RFC 5465)
+aioimaplib.Commands.setdefault("NOTIFY", aioimaplib.Cmd(
+    "NOTIFY", (aioimaplib.AUTH, aioimaplib.SELECTED), aioimaplib.Exec.is_sync))
+
+# loading the CA certificates is expensive, so receivers that are
+# not given an SSL context share this one; see `default_ssl_context`
+_SSL_CONTEXT = None
+
+
+def default_ssl_context():
+    """
+    Get the SSL context shared by all receivers that were not
+    given one, creating it on first use.
+    """
+    global _SSL_CONTEXT
+    if _SSL_CONTEXT is None:
+        _SSL_CONTEXT = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+    return _SSL_CONTEXT
+
+
+def quote_mailbox(mailbox: str):
+    """
+    Add double-quotes around the mailbox name if it contains spaces.
+    """
+    return f'"{mailbox}"' if " " in mailbox else mailbox
+
+
+def status_mailbox(line: bytes):
+    """
+    Get the name of the mailbox from a STATUS response line,
+    or None for any other line.
+    """
+    match = _STATUS_RE.match(line)
+    if match is None:
+        return None
+    name = match.group(1).decode("utf-8", "replace")
+    if name.startswith('"'):
+        name = re.sub(r'\\(.)', r'\1', name[1:-1])
+    return name
+
+
+def message_set(ids: List[str]):
+    """
+    Build an IMAP message set from ascending message IDs,
+    collapsing consecutive IDs into ranges, e.g. "1:3,7".
+    """
+    parts = []
+    start = prev = first = None
+    for token in ids:
+        id = int(token)
+        if prev is not None and id == prev + 1:
+            prev = id
+            continue
+        if start is not None:
+            # single IDs are passed on as given; str() returns
+            # a string ID itself without copying
+            parts.append(f"{start}:{prev}" if prev > start else str(first))
+        start = prev = id
+        first = token
+    if start is not None:
+        parts.append(f"{start}:{prev}" if prev > start else str(first))
+    return ",".join(parts)
+
+
+def parse_push(msg: list, others: List[str]):
+    """
+    Find out from an IDLE push whether the selected mailbox has
+    grown and which of the `others` mailboxes reported changes.
+    """
+    # https://tools.ietf.org/html/rfc3501#section-7.3.1
+    # EXISTS response occurs when size of the mailbox changes
+    # aioimaplib delivers untagged responses as bytes,
+    # e.g. b"3 EXISTS"; they are matched in a single scan over
+    # all lines of the push. Most pushes are a single line, which
+    # is scanned as is.
+    blob = msg[0] if len(msg) == 1 else b"\n".join(msg)
+    exists = _EXISTS_RE.search(blob) is not None
+    changed = []
+    if others and b"STATUS " in blob:
+        for name in map(status_mailbox, msg):
+            if name in others and name not in changed:
+                changed.append(name)
+    return exists, changed
+
+
+def handle_message(
+    callback: Callable[[Message], Any], body: bytes, mailbox: str = None,
+):
+    """
+    Parse the message and pass it on to the callback.
+    """
+    try:
+        callback(Message(body, mailbox))
+    except:
+        logging.exception("handle_message: Callback failed")
+
+
+async def handle_message_async(
+    callback: Callable[[Message], Awaitable[Any]],
+    body: bytes,
+    executor: Executor,
+    mailbox: str = None,
+):
+    """
+    Parse the message in the `executor` and await the
+    coroutine callback with it.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        await callback(
+            await loop.run_in_executor(executor, Message, body, mailbox))
+    except Exception:
+        logging.exception("handle_message_async: Callback failed")
+
+
+class ImapPool(object):
+    """
+    Pool of connections to a single account. The receiver's own
+    connection is dedicated to IDLE; the pool holds a second, work
+    connection for SEARCH and FETCH so that downloading messages
+    does not require leaving IDLE.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        user: str,
+        password: str,
+        port: int = aioimaplib.IMAP4_SSL_PORT,
+        timeout: float = aioimaplib.IMAP4.TIMEOUT_SECONDS,
+        keepalive_interval: float = KEEPALIVE_INTERVAL,
+        ssl_context: ssl.SSLContext = None,
+    ):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self.ssl_context = ssl_context
+        self.work_client = None
+        self.work_client_lock = asyncio.Lock()
+        # mailbox to select again when the work client reconnects
+        self.mailbox = None
+        self._task_keepalive = None
+
+    async def open(self):
+        """
+        Connect and login the work client.
+        """
+        await self._connect()
+        logging.info("ImapPool:open: Work client logged in")
+
+        self._task_keepalive = asyncio.create_task(self.keepalive())
+
+    async def _connect(self):
+        """
+        Replace the work client with a new, logged in one that
+        has `mailbox` selected, if set.
+        """
+        async with self.work_client_lock:
+            work_client = aioimaplib.IMAP4_SSL(
+                host=self.host, port=self.port, timeout=self.timeout,
+                ssl_context=self.ssl_context)
+            try:
+                await work_client.wait_hello_from_server()
+                response = await work_client.login(self.user, self.password)
+                if response.result != "OK":
+                    raise RuntimeError("Login failed.")
+                if self.mailbox is not None:
+                    response = await work_client.select(mailbox=self.mailbox)
+                    if response.result != "OK":
+                        raise RuntimeError(
+                            f"Selecting mailbox '{self.mailbox}' failed with status '{response.result}'.")
+            except BaseException:
+                if work_client.protocol.transport is not None:
+                    work_client.protocol.transport.close()
+                raise
+            self.work_client = work_client
+
+    def usable(self):
+        """
+        Whether the work client is connected and logged in.
+        """
+        work_client = self.work_client
+        return (
+            work_client is not None
+            and work_client.protocol.transport is not None
+            and not work_client.protocol.transport.is_closing()
+            and work_client.protocol.state in (aioimaplib.AUTH, aioimaplib.SELECTED))
+
+    def drop(self):
+        """
+        Close the work client's connection after a failed command,
+        as its state is unknown. `keepalive` connects it again.
+        """
+        work_client, self.work_client = self.work_client, None
+        if (
+            work_client is not None
+            and work_client.protocol.transport is not None
+        ):
+            work_client.protocol.transport.close()
+
+    async def select(self, mailbox: str):
+        """
+        Select `mailbox` on the work client, and again whenever it
+        reconnects. Drops the work client if this fails instead of
+        raising, so that a lost work connection does not stop the
+        receiver.
+        """
+        async with self.work_client_lock:
+            self.mailbox = mailbox
+            if not self.usable():
+                return
+            try:
+                response = await self.work_client.select(mailbox=mailbox)
+                if response.result == "OK":
+                    return
+                logging.warning(f"ImapPool:select: Selecting mailbox '{mailbox}' completed with status '{response.result}'")
+            except Exception as e:
+                logging.warning(f"ImapPool:select: Selecting mailbox '{mailbox}' failed: {e!r}")
+            self.drop()
+
+    async def keepalive(self):
+        """
+        Periodically send NOOP on the work client, and connect it
+        again if its connection was lost.
+        """
+        delay = RECONNECT_DELAY
+        while True:
+            if self.usable():
+                await asyncio.sleep(self.keepalive_interval)
+                try:
+                    async with self.work_client_lock:
+                        if self.usable():
+                            logging.debug("ImapPool:keepalive: Send NOOP")
+                            await self.work_client.noop()
+                    continue
+                except Exception as e:
+                    logging.warning(f"ImapPool:keepalive: NOOP failed: {e!r}")
+                    self.drop()
+
+            try:
+                await self._connect()
+                logging.info("ImapPool:keepalive: Work client reconnected")
+                delay = RECONNECT_DELAY
+            except Exception as e:
+                # expected while the server is unreachable, so
+                # skip formatting a traceback on every retry
+                logging.warning(f"ImapPool:keepalive: Reconnecting the work client failed: {e!r}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY) + random.random()
+
+    async def close(self):
+        """
+        Logout the work client.
+        """
+        if self._task_keepalive is not None:
+            self._task_keepalive.cancel()
+            self._task_keepalive = None
+
+        async with self.work_client_lock:
+            if self.usable():
+                await self.work_client.logout()
+                logging.info("ImapPool:close: Work client logged out")
+            else:
+                self.drop()
+            self.work_client = None
+
+    def detach(self):
+        """
+        Stop the keepalive and hand over the work client. Returns
+        None if its connection is no longer usable.
+        """
+        task, self._task_keepalive = self._task_keepalive, None
+        if task is not None:
+            task.cancel()
+        if not self.usable():
+            self.drop()
+            return None
+        work_client, self.work_client = self.work_client, None
+        return work_client
 
 
 class Receiver(object):
 
-    def __init__(self):
-        self.imap_client_lock = asyncio.Lock()
-        self.should_exit = asyncio.Event()
-        self.exit_event = asyncio.Event()
+    __slots__ = (
+        "idle_timeout",
+        "work_connection",
+        "hot_spare",
+        "ssl_context",
+        "pool",
+        "spare",
+        "imap_client",
+        "current_mailbox",
+        "_uidnext",
+        "_task_wfnm",
+        "_task_spare",
+        "_idle",
+        "_executor",
+        "heavy_executor",
+        "_pending_callbacks",
+        "_callback_slots",
+        "_callback_is_coro",
+        "imap_client_lock",
+        "_idle_interrupt",
+        "should_exit",
+        "exit_event",
+    )
+
+    def __init__(
+        self,
+        idle_timeout: float = IDLE_TIMEOUT,
+        work_connection: bool = False,
+        ssl_context: ssl.SSLContext = None,
+        hot_spare: bool = False,
+        heavy_executor: Executor = None,
+    ):
+        self.idle_timeout = idle_timeout
+        self.work_connection = work_connection
+        # keep a second, logged in connection ready to switch to
+        # when the connection is lost
+        self.hot_spare = hot_spare
+        # shared by all connections of the receiver, including
+        # those made on reconnect; defaults to the context shared
+        # by all receivers on first connect
+        self.ssl_context = ssl_context
+        self.pool = None
+        self.spare = None
+        self.imap_client = None
+        self.current_mailbox = None
+        # UID of the first message not yet fetched from the current
+        # mailbox, if the server reported it
+        self._uidnext = None
+        self._task_wfnm = None
+        self._task_spare = None
+        self._idle = None
+        self._executor = ThreadPoolExecutor(max_workers=CALLBACK_WORKERS)
+        # large messages are parsed, and synchronous callbacks run,
+        # in this executor instead, e.g. a ProcessPoolExecutor so
+        # parsing big attachments does not hold the GIL; the
+        # callback must then be picklable
+        self.heavy_executor = heavy_executor
+        self._pending_callbacks = set()
+        self._callback_is_coro = False
+        # created in `run` on the loop it runs on, since the receiver
+        # may be constructed without one; None until then
+        self._callback_slots = None
+        self.imap_client_lock = None
+        self._idle_interrupt = None
+        self.should_exit = None
+        self.exit_event = None
 
     async def run(
         self,
@@ -30,61 +424,123 @@ class Receiver(object):
         user: str,
         password: str,
         callback: Callable[[Message], Any],
-        mailbox: str = "INBOX",
+        mailbox: Union[str, List[str]] = "INBOX",
         install_signal_handlers: bool = True,
+        fetch_spec: str = FETCH_FULL,
     ):
         """
-        Start running the main receiver loop.
+        Start running the main receiver loop. `mailbox` may be a
+        list of mailboxes; see `wait_for_new_message`.
         """
-        # create the imap client
-        self.imap_client = aioimaplib.IMAP4_SSL(host=host)
+        loop = asyncio.get_running_loop()
 
-        # callback for when connection is lost
-        def conn_lost_cb(exc):
-            loop = self.imap_client.protocol.loop
-            loop.create_task(self.reconnect())
-        self.imap_client.protocol.conn_lost_cb = conn_lost_cb
+        self._callback_slots = asyncio.Semaphore(MAX_PENDING_CALLBACKS)
+        # asyncio.Lock takes an uncontended lock without suspending,
+        # and a released lock goes to the longest waiter even if the
+        # releasing task tries to take it back right away, which the
+        # IDLE loop relies on to hand over the client
+        self.imap_client_lock = asyncio.Lock()
+        self._idle_interrupt = asyncio.Event()
+        self.should_exit = asyncio.Event()
+        self.exit_event = asyncio.Event()
 
         # signal handlers
         if install_signal_handlers:
             logging.debug("Receiver:run: Installing signal handlers")
-            self.install_signal_handlers()
+            self.install_signal_handlers(loop)
 
-        logging.debug("Receiver:run: Clear exit and should_exit events")
-        self.exit_event.clear()
-        self.should_exit.clear()
+        # callbacks may be plain functions or coroutine functions
+        self._callback_is_coro = asyncio.iscoroutinefunction(callback)
 
         self._task_wfnm = None
 
+        # connect to the server; the connection is reused for
+        # every login and only recreated if it is lost
+        try:
+            await self.connect(host)
+        except (OSError, TimeoutError):
+            logging.exception("Receiver:run: Connecting failed")
+            await self.reconnect()
+
         while not self.should_exit.is_set():
-            if await self.login(user, password):
-                # start waiting for new messages
-                try:
-                    self._task_wfnm = asyncio.create_task(
-                        self.wait_for_new_message(callback, mailbox))
-                    await self._task_wfnm
+            # the work connection has a session of its own, so it
+            # is opened while the receiver's connection logs in
+            if self.work_connection:
+                logged_in, _ = await asyncio.gather(
+                    self.login(user, password),
+                    self.open_pool(user, password))
+                if not logged_in:
+                    await self.close_pool()
+            else:
+                logged_in = await self.login(user, password)
 
-                except Exception as e:
-                    if isinstance(e, CancelledError):
+            if logged_in:
+                if (
+                    self.hot_spare
+                    and self.spare is None
+                    and (self._task_spare is None or self._task_spare.done())
+                ):
+                    self._task_spare = asyncio.create_task(
+                        self.open_spare(user, password))
+
+                connection_lost = False
+                while not self.should_exit.is_set():
+                    # start waiting for new messages
+                    task = self._task_wfnm = asyncio.create_task(
+                        self.wait_for_new_message(
+                            callback, mailbox, fetch_spec))
+                    try:
+                        await task
+
+                    except TimeoutError:
+                        # the session is still intact, so keep it
+                        # and resume waiting for new messages
+                        logging.warning("Receiver:run: wait_for_new_message timed out")
+                        continue
+
+                    except CancelledError:
+                        # `reconnect` unsets the task before cancelling
+                        # it and run() only gets here once the task
+                        # is done; otherwise run() itself is cancelled
+                        if self._task_wfnm is task or not task.done():
+                            raise
                         logging.debug("Receiver:run: wait_for_new_message task cancelled")
-                    else:
-                        logging.error(traceback.format_exc())
+                        connection_lost = True
+
+                    except Exception:
+                        logging.exception("Receiver:run: wait_for_new_message failed")
                         logging.debug("Receiver:run: Set should_exit event")
                         self.should_exit.set()
 
-                # send a receiver stopped
+                    break
+
+                # let the callbacks of messages received so far
+                # finish first, then send a receiver stopped
                 # message to the callback
+                if self._pending_callbacks:
+                    await asyncio.wait(self._pending_callbacks)
                 logging.info("Receiver:run: Called callback with RECEIVER_STOPPED message")
                 try:
-                    callback(RECEIVER_STOPPED)
+                    if self._callback_is_coro:
+                        await callback(RECEIVER_STOPPED)
+                    else:
+                        # like messages, keep blocking callbacks off
+                        # the event loop
+                        await loop.run_in_executor(
+                            self._executor, callback, RECEIVER_STOPPED)
                 except:
-                    logging.error(traceback.format_exc())
+                    logging.exception("Receiver:run: Callback failed on RECEIVER_STOPPED")
 
-                # logout
+                # logout; after a lost connection `reconnect` may
+                # already have replaced the client, which must not
+                # be logged out
                 try:
-                    await self.logout()
+                    if connection_lost:
+                        await self.close_pool()
+                    else:
+                        await self.logout()
                 except:
-                    logging.error(traceback.format_exc())
+                    logging.exception("Receiver:run: Logout failed")
                     logging.debug("Receiver:run: Set should_exit event")
                     self.should_exit.set()
 
@@ -93,9 +549,111 @@ class Receiver(object):
             else:
                 logging.info("Receiver:run: Retrying")
 
+        await self.close_spare()
+
         logging.debug("Receiver:run: Set exit event")
         self.exit_event.set()
 
+    async def connect(
+        self,
+        host: str,
+        port: int = aioimaplib.IMAP4_SSL_PORT,
+        timeout: float = aioimaplib.IMAP4.TIMEOUT_SECONDS,
+    ):
+        """
+        Create the IMAP client and wait for the server greeting.
+        """
+        if self.ssl_context is None:
+            self.ssl_context = default_ssl_context()
+        self.set_client(aioimaplib.IMAP4_SSL(
+            host=host, port=port, timeout=timeout,
+            ssl_context=self.ssl_context))
+
+        await self.imap_client.wait_hello_from_server()
+        logging.info(f"Receiver:connect: Connected to {host}:{port}")
+
+    def set_client(self, imap_client):
+        """
+        Use `imap_client` as the receiver's connection and
+        reconnect when it is lost.
+        """
+        self.imap_client = imap_client
+
+        # callback for when connection is lost
+        def conn_lost_cb(exc):
+            loop = self.imap_client.protocol.loop
+            loop.create_task(self.reconnect())
+        self.imap_client.protocol.conn_lost_cb = conn_lost_cb
+
+    async def open_pool(self, user: str, password: str):
+        """
+        Open a second connection to the server for SEARCH and
+        FETCH. The receiver falls back to a single connection if
+        this fails.
+        """
+        self.pool = ImapPool(
+            self.imap_client.host,
+            user,
+            password,
+            port=self.imap_client.port,
+            timeout=self.imap_client.timeout,
+            ssl_context=self.ssl_context)
+        try:
+            await self.pool.open()
+        except:
+            logging.exception("Receiver:open_pool: Opening the pool failed")
+            await self.close_pool()
+
+    async def close_pool(self):
+        """
+        Close the second connection if it is open.
+        """
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            try:
+                await pool.close()
+            except:
+                logging.exception("Receiver:close_pool: Closing the pool failed")
+
+    async def open_spare(self, user: str, password: str):
+        """
+        Open a logged in spare connection for `reconnect` to
+        switch to. It is kept alive like the work connection.
+        """
+        spare = ImapPool(
+            self.imap_client.host,
+            user,
+            password,
+            port=self.imap_client.port,
+            timeout=self.imap_client.timeout,
+            ssl_context=self.ssl_context)
+        try:
+            await spare.open()
+        except Exception:
+            logging.exception("Receiver:open_spare: Opening the spare connection failed")
+            try:
+                await spare.close()
+            except Exception:
+                pass
+            return
+        self.spare = spare
+
+    async def close_spare(self):
+        """
+        Close the spare connection if it is open.
+        """
+        task, self._task_spare = self._task_spare, None
+        if task is not None:
+            task.cancel()
+            await asyncio.wait((task,))
+
+        spare, self.spare = self.spare, None
+        if spare is not None:
+            try:
+                await spare.close()
+            except Exception:
+                logging.exception("Receiver:close_spare: Closing the spare connection failed")
+
     async def login(self, user: str, password: str):
         """
         Login to the IMAP server.
@@ -105,7 +663,11 @@ class Receiver(object):
             async with self.imap_client_lock:
                 logging.debug("Receiver:login: Obtained imap client lock")
 
-                await self.imap_client.wait_hello_from_server()
+                if self.imap_client.protocol.state in (
+                        aioimaplib.AUTH, aioimaplib.SELECTED):
+                    # a spare connection is already logged in
+                    return True
+
                 response = await self.imap_client.login(user, password)
 
             if response.result != "OK":
@@ -113,14 +675,29 @@ class Receiver(object):
             logging.info("Receiver:login: Logged in as {}".format(user))
 
         except:
-            logging.error(traceback.format_exc())
+            logging.exception("Receiver:login: Login failed")
             return False
 
         return True
 
-    async def change_mailbox(self, mailbox: str):
+    async def change_mailbox(self, mailbox: str, timeout: float = SELECT_TIMEOUT):
         """
-        Switch to another mailbox.
+        Switch to another mailbox. Raises TimeoutError if this
+        takes longer than `timeout` seconds.
+        """
+        async def select():
+            logging.debug("Receiver:change_mailbox: Waiting for imap client lock")
+            async with self.client_lock():
+                logging.debug("Receiver:change_mailbox: Obtained imap client lock")
+
+                return await self._change_mailbox_locked(mailbox)
+
+        # bound waiting for the lock as well as the SELECT itself
+        return await asyncio.wait_for(select(), timeout)
+
+    async def _change_mailbox_locked(self, mailbox: str):
+        """
+        Switch to another mailbox while holding the imap client lock.
         """
         if not (
             isinstance(mailbox, str)
@@ -130,206 +707,619 @@ class Receiver(object):
                 "Invalid input. `mailbox` must"
                 " be a non-empty string.")
 
-        # add double-quotes around mailbox name if it contains
-        # spaces
-        mailbox = f'"{mailbox}"' if " " in mailbox else mailbox
-
-        logging.debug("Receiver:change_mailbox: Waiting for imap client lock")
-        async with self.imap_client_lock:
-            logging.debug("Receiver:change_mailbox: Obtained imap client lock")
-
-            response = await self.imap_client.select(mailbox=mailbox)
+        quoted = quote_mailbox(mailbox)
+        response = await self.imap_client.select(mailbox=quoted)
 
         if response.result != "OK":
             raise RuntimeError(
                 f"Selecting mailbox '{mailbox}' failed with status '{response.result}'.")
 
+        self._uidnext = None
+        for line in response.lines:
+            match = _UIDNEXT_RE.search(line)
+            if match is not None:
+                self._uidnext = int(match.group(1))
+
+        if self.pool is not None:
+            await self.pool.select(quoted)
+
         logging.info(f"Receiver:change_mailbox: Selected mailbox '{mailbox}'")
         self.current_mailbox = mailbox
 
         return response
 
+    async def notify(self, mailboxes: List[str]):
+        """
+        Ask the server to report new messages in `mailboxes`, as
+        well as in the selected mailbox, while the client is in
+        IDLE. Returns False if the server does not support NOTIFY.
+        URL: https://tools.ietf.org/html/rfc5465
+        """
+        imap_client = self.imap_client
+        protocol = imap_client.protocol
+
+        # capabilities may change after login; only the protocol
+        # can ask for them again
+        await asyncio.wait_for(protocol.capability(), imap_client.timeout)
+        if not imap_client.has_capability("NOTIFY"):
+            return False
+
+        command = aioimaplib.Command(
+            "NOTIFY", protocol.new_tag(), "SET",
+            f"(selected {NOTIFY_EVENTS})",
+            "(mailboxes ({}) {})".format(
+                " ".join(map(aioimaplib.quoted, mailboxes)), NOTIFY_EVENTS),
+            loop=protocol.loop)
+        response = await asyncio.wait_for(
+            protocol.execute(command), imap_client.timeout)
+        if response.result != "OK":
+            raise RuntimeError(
+                f"NOTIFY failed with status '{response.result}'.")
+
+        logging.info(f"Receiver:notify: Watching mailboxes {mailboxes}")
+        return True
+
+    async def fetch_mailbox(
+        self, mailbox: str, imap_client, fetch_spec: str = FETCH_FULL,
+    ):
+        """
+        Fetch the unseen messages in another mailbox than the
+        current one with `imap_client`, then select the current
+        mailbox again.
+        """
+        bodies = []
+        try:
+            response = await imap_client.select(quote_mailbox(mailbox))
+            if response.result == "OK":
+                bodies = await self.fetch(
+                    await self._search_unseen_locked(imap_client),
+                    imap_client, fetch_spec)
+            else:
+                logging.error(f"Receiver:fetch_mailbox: Selecting mailbox '{mailbox}' completed with status '{response.result}'")
+        finally:
+            await imap_client.select(quote_mailbox(self.current_mailbox))
+        return bodies
+
     async def search_unseen(self):
         """
         Get IDs of unseen messages in the current mailbox.
         URL: https://tools.ietf.org/html/rfc3501#section-6.4.4
         """
+        async with self.client_lock():
+            return await self._search_unseen_locked(self.imap_client)
+
+    async def _search_unseen_locked(self, imap_client, before_uid=None):
+        """
+        Get IDs of unseen messages in the current mailbox while
+        holding the lock of `imap_client`. If `before_uid` is given,
+        only messages with a lower UID are included.
+        """
         unseen_ids = []
-        status, response = await self.imap_client.search("(UNSEEN)", charset=None)
+        criteria = ["(UNSEEN)"]
+        if before_uid is not None:
+            if before_uid <= 1:
+                return unseen_ids
+            criteria += ["UID", f"1:{before_uid - 1}"]
+        status, response = await imap_client.search(*criteria, charset=None)
         if status == "OK":
-            unseen_ids.extend(response[0].split())
+            unseen_ids.extend(response[0].decode("ascii").split())
             logging.info(f"Receiver:search_unseen: Number of unseen messages: {len(unseen_ids)}")
         else:
             logging.error(f"Receiver:search_unseen: Search for unseen messages completed with status '{status}'")
         return unseen_ids
 
+    async def fetch(
+        self, ids: List[str], imap_client, fetch_spec: str = FETCH_FULL,
+    ):
+        """
+        Fetch the messages with the given string IDs, as returned
+        by `search_unseen`, with `imap_client`, up to
+        FETCH_BATCH_SIZE per FETCH command, and return the contents
+        requested by `fetch_spec`.
+        URL: https://tools.ietf.org/html/rfc3501#section-6.4.5
+        """
+        bodies = []
+
+        append = bodies.append
+
+        for i in range(0, len(ids), FETCH_BATCH_SIZE):
+            response = await imap_client.fetch(
+                message_set(ids[i:i + FETCH_BATCH_SIZE]), fetch_spec)
+
+            # every message in the response is a `<id> FETCH (<item> {<size>}`
+            # line followed by the message literal and a closing `)` line;
+            # aioimaplib >= 1.0 delivers all of them as bytes
+            lines = iter(response.lines)
+            for line in lines:
+                if line.endswith(b"}"):
+                    body = next(lines, None)
+                    if body is not None:
+                        append(body)
+
+            # only the literals are needed; do not keep the rest of
+            # the response alive while fetching the next batch
+            del response, lines
+
+        return bodies
+
+    async def fetch_new(self, imap_client, fetch_spec: str = FETCH_FULL):
+        """
+        Fetch the messages that arrived in the current mailbox since
+        it was selected or since the last call with `imap_client`,
+        by UID and without searching first. Falls back to fetching
+        the unseen messages if the server did not report UIDNEXT.
+        URL: https://tools.ietf.org/html/rfc3501#section-6.4.8
+        """
+        uidnext = self._uidnext
+        if uidnext is None:
+            return await self.fetch(
+                await self._search_unseen_locked(imap_client),
+                imap_client, fetch_spec)
+
+        response = await imap_client.uid(
+            "fetch", f"{uidnext}:*", "(UID " + fetch_spec[1:])
+        if response.result != "OK":
+            logging.error(f"Receiver:fetch_new: Fetch completed with status '{response.result}'")
+            return []
+
+        # the UID comes before the message literal or in the
+        # closing line after it, depending on the server
+        bodies = []
+        lines = iter(response.lines)
+        for line in lines:
+            if line.endswith(b"}"):
+                body = next(lines, None)
+                if body is None:
+                    break
+                match = _UID_RE.search(line) or _UID_RE.search(next(lines, b""))
+                # "<uidnext>:*" also matches the last message if
+                # there is no newer one
+                if match is not None and int(match.group(1)) >= uidnext:
+                    bodies.append(body)
+                    self._uidnext = max(self._uidnext, int(match.group(1)) + 1)
+        del response, lines
+
+        logging.info(f"Receiver:fetch_new: Number of new messages: {len(bodies)}")
+        return bodies
+
+    async def dispatch(
+        self,
+        callback: Callable[[Message], Any],
+        body: bytes,
+        mailbox: str = None,
+    ):
+        """
+        Parse the message and hand it to the callback without
+        waiting for it. Synchronous callbacks run in the thread
+        pool, coroutine callbacks as tasks on the event loop.
+        """
+        # limit the number of outstanding callbacks
+        await self._callback_slots.acquire()
+
+        executor = self._executor
+        if self.heavy_executor is not None and len(body) > HEAVY_MESSAGE_SIZE:
+            executor = self.heavy_executor
+
+        if self._callback_is_coro:
+            future = asyncio.create_task(handle_message_async(
+                callback, body, executor, mailbox))
+        else:
+            future = asyncio.get_running_loop().run_in_executor(
+                executor, handle_message, callback, body, mailbox)
+        self._pending_callbacks.add(future)
+        future.add_done_callback(self._callback_done)
+
+    async def dispatch_all(
+        self,
+        callback: Callable[[Message], Any],
+        bodies: List[tuple],
+    ):
+        """
+        Dispatch the `(body, mailbox)` pairs in `bodies` in order,
+        emptying the list.
+        """
+        # pop the messages off the list as they are handed out, so
+        # each one can be freed once its callback is done instead
+        # of after the whole batch
+        bodies.reverse()
+        while bodies:
+            body, mailbox = bodies.pop()
+            await self.dispatch(callback, body, mailbox)
+
+    def _callback_done(self, future):
+        self._pending_callbacks.discard(future)
+        self._callback_slots.release()
+
     async def wait_for_new_message(
-        self, callback: Callable[[Message], Any], mailbox: str = "INBOX",
+        self,
+        callback: Callable[[Message], Any],
+        mailbox: Union[str, List[str]] = "INBOX",
+        fetch_spec: str = FETCH_FULL,
     ):
         """
         Receiver infinite loop waiting for new messages.
+
+        If `mailbox` is a list, the first mailbox is selected and
+        the others are watched over the same connection with IMAP
+        NOTIFY, if the server supports it.
         """
-        # select the mailbox
-        await self.change_mailbox(mailbox)
+        if isinstance(mailbox, str):
+            others = []
+        else:
+            mailbox, *others = mailbox
 
-        # if new messages are available, fetch
-        # them and let the callback handle it
-        for id in await self.search_unseen():
-            response = await self.imap_client.fetch(
-                str(id), "(RFC822)")
-            if len(response.lines) > 1:
-                try:
-                    callback(Message(response.lines[1]))
-                except:
-                    logging.error(traceback.format_exc())
+        # hold the lock for as long as the receiver is waiting for
+        # new messages; other users of the client ask for it via
+        # `client_lock`, which interrupts IDLE
+        lock = self.imap_client_lock
+        logging.debug("Receiver:wait_for_new_message: Waiting for imap client lock")
+        await lock.acquire()
+        locked = True
+        logging.debug("Receiver:wait_for_new_message: Obtained imap client lock")
 
-        while True:
-            logging.debug("Receiver:wait_for_new_message: Waiting for imap client lock")
+        # the client is only replaced after this task is cancelled,
+        # so look up the methods used on every iteration once.
+        # has_pending_idle stays the source of truth for whether
+        # the client is in IDLE, since the server may end IDLE
+        # without being asked.
+        imap_client = self.imap_client
+        idle_start = imap_client.idle_start
+        idle_timeout = self.idle_timeout
+        has_pending_idle = imap_client.has_pending_idle
+        idle_queue = imap_client.protocol.idle_queue
+        idle_queue_empty = idle_queue.empty
+        wait_server_push = self._wait_server_push
+        dispatch_all = self.dispatch_all
+        debug = logging.debug
+        bodies = []
 
-            async with self.imap_client_lock:
-                logging.debug("Receiver:wait_for_new_message: Obtained imap client lock")
+        try:
+            # select the mailbox; the lock is already held and
+            # every SELECT is bounded by the client's own timeout
+            await self._change_mailbox_locked(mailbox)
+
+            # if new messages are available, fetch them
+            # all at once and let the callback handle it; messages
+            # from UIDNEXT on are left to `fetch_new`
+            ids = await self._search_unseen_locked(
+                imap_client, before_uid=self._uidnext)
+            bodies.extend(
+                (body, self.current_mailbox)
+                for body in await self.fetch(ids, imap_client, fetch_spec))
+
+            if others:
+                if await self.notify(others):
+                    for other in others:
+                        bodies.extend(
+                            (body, other)
+                            for body in await self.fetch_mailbox(
+                                other, imap_client, fetch_spec))
+                else:
+                    logging.warning(f"Receiver:wait_for_new_message: Server does not support NOTIFY, only watching mailbox '{mailbox}'")
+                    others = []
+
+            while True:
+                if bodies or self._idle_interrupt.is_set():
+                    # the callbacks do not need the client and waiting
+                    # for a free callback slot may take a while, so
+                    # release the lock and let others have it meanwhile
+                    debug("Receiver:wait_for_new_message: Hand over imap client lock")
+                    self._idle_interrupt.clear()
+                    lock.release()
+                    locked = False
+                    await dispatch_all(callback, bodies)
+                    await lock.acquire()
+                    locked = True
+                    debug("Receiver:wait_for_new_message: Obtained imap client lock")
+
+                if self.should_exit.is_set():
+                    debug("Receiver:wait_for_new_message: Exit requested")
+                    break
 
                 # start IDLE waiting
                 # idle queue must be empty, otherwise we get race
                 # conditions between idle command status update
                 # and unsolicited server messages
                 if (
-                    (not self.imap_client.has_pending_idle())
-                    and self.imap_client.protocol.idle_queue.empty()
+                    (not has_pending_idle())
+                    and idle_queue_empty()
                 ):
-                    logging.debug("Receiver:wait_for_new_message: Start IDLE waiting")
-                    self._idle = await self.imap_client.idle_start()
+                    debug("Receiver:wait_for_new_message: Start IDLE waiting")
+                    self._idle = await idle_start(timeout=idle_timeout)
+
+                # wait for status updates; stay in IDLE until the
+                # mailbox size changes, the IDLE timeout expires or
+                # another coroutine needs the client
+                exists = False
+                changed = []
+                timed_out = False
+                while not (exists or changed):
+                    if not has_pending_idle() and idle_queue_empty():
+                        # IDLE has ended, e.g. pushes left over from
+                        # the previous IDLE were read without IDLE
+                        # being started again; restart it rather
+                        # than wait for pushes that will not come
+                        debug("Receiver:wait_for_new_message: Not in IDLE")
+                        break
+
+                    msg = await wait_server_push()
+                    debug(f"Receiver:wait_for_new_message: Received IDLE message: {msg}")
+
+                    if msg is None:
+                        debug("Receiver:wait_for_new_message: IDLE interrupted")
+                        break
+
+                    if msg == aioimaplib.STOP_WAIT_SERVER_PUSH:
+                        debug("Receiver:wait_for_new_message: IDLE timeout")
+                        break
+
+                    exists, changed = parse_push(msg, others)
+                    if not (exists or changed):
+                        continue
+
+                    # let a burst of pushes settle and handle all
+                    # of them at once
+                    await self._wait_exit(PUSH_DEBOUNCE)
+                    while not idle_queue_empty():
+                        msg = idle_queue.get_nowait()
+                        if msg == aioimaplib.STOP_WAIT_SERVER_PUSH:
+                            timed_out = True
+                            continue
+                        more_exists, more_changed = parse_push(msg, others)
+                        exists = exists or more_exists
+                        changed += [
+                            name for name in more_changed
+                            if name not in changed]
 
-                # wait for status update
-                msg = await self.imap_client.wait_server_push()
-                logging.debug(f"Receiver:wait_for_new_message: Received IDLE message: {msg}")
+                    pool = self.pool
+                    if pool is not None and pool.usable():
+                        # fetch using the work client and stay in IDLE
+                        debug("Receiver:wait_for_new_message: Mailbox size changed")
+                        try:
+                            async with pool.work_client_lock:
+                                # keepalive may have dropped the work
+                                # client while waiting for the lock
+                                if not pool.usable():
+                                    debug("Receiver:wait_for_new_message: Work client lost")
+                                    break
+                                work_client = pool.work_client
+                                if exists:
+                                    bodies.extend(
+                                        (body, self.current_mailbox)
+                                        for body in await self.fetch_new(
+                                            work_client, fetch_spec))
+                                for other in changed:
+                                    bodies.extend(
+                                        (body, other)
+                                        for body in await self.fetch_mailbox(
+                                            other, work_client, fetch_spec))
+                        except Exception as e:
+                            # the pool connects the work client again
+                            # by itself; meanwhile, fetch with the
+                            # IDLE client below
+                            logging.warning(f"Receiver:wait_for_new_message: Fetching with the work client failed: {e!r}")
+                            pool.drop()
+                            break
+                        await dispatch_all(callback, bodies)
+                        exists = False
+                        changed = []
+
+                        if timed_out:
+                            debug("Receiver:wait_for_new_message: IDLE timeout")
+                            break
 
                 # send IDLE done to server; this has to happen
                 # before search or fetch or any other command
                 # for some reason.
                 # https://tools.ietf.org/html/rfc2177
-                if self.imap_client.has_pending_idle():
-                    logging.debug("Receiver:wait_for_new_message: Send IDLE done")
-                    self.imap_client.idle_done()
-                    await asyncio.wait_for(self._idle, 10)
-
-                # https://tools.ietf.org/html/rfc3501#section-7.3.1
-                # EXISTS response occurs when size of the mailbox changes
-                if isinstance(msg, list) and any("EXISTS" in m for m in msg):
-                    logging.debug("Receiver:wait_for_new_message: Mailbox size changed")
-
-                    # if new messages are available, fetch
-                    # them and let the callback handle it
-                    for id in await self.search_unseen():
-                        response = await self.imap_client.fetch(
-                            str(id), "(RFC822)")
-                        if len(response.lines) > 1:
-                            try:
-                                callback(Message(response.lines[1]))
-                            except:
-                                logging.error(traceback.format_exc())
-
-            logging.debug("Receiver:wait_for_new_message: Loop complete")
+                # aioimaplib holds back the next command until the
+                # IDLE command completes, without a timeout of its
+                # own, so wait for it here
+                if has_pending_idle():
+                    debug("Receiver:wait_for_new_message: Send IDLE done")
+                    imap_client.idle_done()
+                    await asyncio.wait_for(self._idle, IDLE_DONE_TIMEOUT)
+
+                # fetch from the other mailboxes first; new messages
+                # in the current mailbox are not reported while
+                # another one is selected, so search it afterwards
+                for other in changed:
+                    debug(f"Receiver:wait_for_new_message: Mailbox '{other}' changed")
+                    bodies.extend(
+                        (body, other)
+                        for body in await self.fetch_mailbox(
+                            other, imap_client, fetch_spec))
+
+                if exists or changed:
+                    debug("Receiver:wait_for_new_message: Mailbox size changed")
+
+                    # fetch the new messages all at once; they are
+                    # handed to the callback at the start of the
+                    # next iteration
+                    bodies.extend(
+                        (body, self.current_mailbox)
+                        for body in await self.fetch_new(imap_client, fetch_spec))
+
+                debug("Receiver:wait_for_new_message: Loop complete")
+
+        finally:
+            if locked:
+                lock.release()
+
+            # fetched messages are already marked as seen and past
+            # the UID watermark, so still hand them to the callback
+            # if fetching more failed or the task was cancelled
+            if bodies:
+                logging.info(f"Receiver:wait_for_new_message: Dispatching {len(bodies)} fetched messages before returning")
+                await dispatch_all(callback, bodies)
+
+    async def _wait_server_push(self):
+        """
+        Wait for the next server push while in IDLE. Returns None
+        if interrupted by `client_lock` or exit first.
+        """
+        push = asyncio.ensure_future(self.imap_client.wait_server_push())
+        interrupt = asyncio.ensure_future(self._idle_interrupt.wait())
+        stop = asyncio.ensure_future(self.should_exit.wait())
+        try:
+            await asyncio.wait(
+                {push, interrupt, stop}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            interrupt.cancel()
+            stop.cancel()
+            if not push.done():
+                push.cancel()
+
+        return push.result() if push.done() else None
+
+    async def _wait_exit(self, timeout: float):
+        """
+        Wait up to `timeout` seconds for exit to be requested.
+        Returns whether it was; unlike `asyncio.wait_for`, running
+        out of time does not raise.
+        """
+        stop = asyncio.ensure_future(self.should_exit.wait())
+        try:
+            await asyncio.wait((stop,), timeout=timeout)
+        finally:
+            stop.cancel()
+        return self.should_exit.is_set()
+
+    @asynccontextmanager
+    async def client_lock(self):
+        """
+        Acquire the imap client lock, interrupting IDLE in
+        `wait_for_new_message` if it holds the lock.
+        """
+        self._idle_interrupt.set()
+        async with self.imap_client_lock:
+            yield
 
     async def logout(self):
         """
         Logout from the IMAP server.
         """
+        await self.close_pool()
+
         valid_states = aioimaplib.Commands.get('LOGOUT').valid_states
+        imap_client = self.imap_client
 
         logging.debug("Receiver:logout: Waiting for lock")
-        async with self.imap_client_lock:
+        async with self.client_lock():
             logging.debug("Receiver:logout: Obtained lock")
 
-            if self.imap_client.protocol.state in valid_states:
-                if self.imap_client.has_pending_idle():
+            if imap_client.protocol.state in valid_states:
+                if imap_client.has_pending_idle():
                     # send IDLE done message to server
                     logging.debug("Receiver:logout: Send IDLE done")
-                    self.imap_client.idle_done()
+                    imap_client.idle_done()
 
                     try:
-                        if hasattr(self, '_idle') and self._idle is not None:
-                            await asyncio.wait_for(self._idle, 10)
+                        if self._idle is not None:
+                            await asyncio.wait_for(
+                                self._idle, IDLE_DONE_TIMEOUT)
                     except TimeoutError:
-                        logging.error(traceback.format_exc())
+                        logging.warning("Receiver:logout: IDLE done timed out")
 
                 try:
-                    await self.imap_client.logout()
+                    await imap_client.logout()
                     logging.info("Receiver:logout: Logged out")
                 except TimeoutError:
-                    logging.error(traceback.format_exc())
+                    logging.warning("Receiver:logout: Logout timed out")
 
             else:
-                logging.debug(f"Receiver:logout: Invalid state '{self.imap_client.protocol.state}'")
+                logging.debug(f"Receiver:logout: Invalid state '{imap_client.protocol.state}'")
 
-    def install_signal_handlers(self):
+    def install_signal_handlers(self, loop: asyncio.AbstractEventLoop = None):
         """
         Install signal handlers to shut down
         the receiver main loop when SIGINT / SIGTERM
-        signals are received.
+        signals are received. `loop` defaults to
+        the running event loop.
         """
         if threading.current_thread() is not threading.main_thread():
             # Signals can only be listened to from the main thread.
             return
 
-        loop = asyncio.get_running_loop()
+        if loop is None:
+            loop = asyncio.get_running_loop()
 
         try:
             for sig in HANDLED_SIGNALS:
                 loop.add_signal_handler(sig, self.handle_exit, sig, None)
         except NotImplementedError:
-            # Windows
+            # Windows; the handler may interrupt the event loop at
+            # any point and the loop may be blocked waiting for I/O,
+            # so set the event from the loop and wake it up
+            def handle_signal(sig, frame):
+                loop.call_soon_threadsafe(self.handle_exit, sig, frame)
+
             for sig in HANDLED_SIGNALS:
-                signal.signal(sig, self.handle_exit)
+                signal.signal(sig, handle_signal)
 
     def handle_exit(self, sig, frame):
         """
-        Handle exiting the receiver main loop.
+        Handle exiting the receiver main loop. Does nothing if
+        the receiver has not started running.
         """
-        if not self.should_exit.is_set():
+        if self.should_exit is None:
+            logging.debug("Receiver:handle_exit: Receiver not running")
+        elif not self.should_exit.is_set():
+            # wait_for_new_message ends IDLE and returns by itself,
+            # so messages being fetched are still delivered
             logging.debug("Receiver:handle_exit: Set should_exit event")
             self.should_exit.set()
 
-            # cancel the wait_for_new_message task
-            if hasattr(self, '_task_wfnm') and self._task_wfnm is not None:
-                self._task_wfnm.cancel()
-                self._task_wfnm = None
-
     async def reconnect(self):
         # cancel the wait_for_new_message task
-        if hasattr(self, '_task_wfnm') and self._task_wfnm is not None:
+        if self._task_wfnm is not None:
             logging.debug("Receiver:reconnect: Cancel wait_for_new_message task")
-            self._task_wfnm.cancel()
+            task = self._task_wfnm
             self._task_wfnm = None
+            task.cancel()
 
-            # give some time for the consequential actions
-            # of cancelling the task to run
-            logging.debug("Receiver:reconnect: Sleep")
-            await asyncio.sleep(1)
+            # wait until the task has finished cancelling and
+            # released the client lock; asyncio.wait does not
+            # raise the task's CancelledError
+            await asyncio.wait((task,))
 
         if not self.should_exit.is_set():
-            # try reconnecting to the server every 5 seconds
+            # keep trying to reconnect to the server with an
+            # increasing delay until it works or exit is requested
             logging.debug("Receiver:reconnect: Waiting for lock")
-            async with self.imap_client_lock:
+            async with self.client_lock():
                 logging.debug("Receiver:reconnect: Obtained lock")
 
+                imap_client = self.imap_client
+                host, port, timeout = (
+                    imap_client.host, imap_client.port, imap_client.timeout)
+                delay = RECONNECT_DELAY
+
+                # switch to the spare connection if there is one; run()
+                # opens a new spare after logging in again
+                spare, self.spare = self.spare, None
+                if spare is not None:
+                    spare_client = spare.detach()
+                    if spare_client is not None:
+                        self.set_client(spare_client)
+                        logging.info("Receiver:reconnect: Switched to the spare connection")
+                        return
+
                 while True:
                     try:
-                        conn_lost_cb = self.imap_client.protocol.conn_lost_cb
-                        self.imap_client = aioimaplib.IMAP4_SSL(
-                            host=self.imap_client.host,
-                            port=self.imap_client.port,
-                            timeout=self.imap_client.timeout)
-                        self.imap_client.protocol.conn_lost_cb = conn_lost_cb
+                        await self.connect(host=host, port=port, timeout=timeout)
 
                         logging.info("Receiver:reconnect: Connection recreated")
                         break
 
-                    except OSError:
-                        logging.error(traceback.format_exc())
-                        await asyncio.sleep(5)
+                    except (OSError, TimeoutError) as e:
+                        logging.warning(f"Receiver:reconnect: Connecting failed: {e!r}")
+                        if await self._wait_exit(delay):
+                            logging.debug("Receiver:reconnect: Exit requested")
+                            break
+                        delay = min(delay * 2, RECONNECT_MAX_DELAY) + random.random()
 
                     except:
-                        logging.error(traceback.format_exc())
+                        logging.exception("Receiver:reconnect: Connecting failed, giving up")
                         self.should_exit.set()
                         break
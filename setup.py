@@ -16,10 +16,19 @@ with readme_path.open('r', encoding='utf8') as f:
     readme = f.read()
 
 install_requires = [
-    "aioimaplib>=0.7.18",
-    "python-dotenv",
-    "fastapi>=0.61",
-    "uvicorn>=0.12"]
+    "aioimaplib>=1.0",
+    "python-dotenv"]
+# uvloop is used where installed; it does not support Windows
+fast_requires = ["uvloop; sys_platform != 'win32'"]
+extras_require = {
+    "fast": fast_requires,
+    # only needed to run the receiver behind the HTTP API,
+    # i.e. `python -m aioimap` or `aioimap.api`
+    "server": [
+        "fastapi>=0.93",
+        "uvicorn>=0.14",
+        "httptools",
+        "orjson"] + fast_requires}
 test_requires = []
 
 setup(
@@ -33,7 +42,9 @@ setup(
     version=about['__version__'],
     license=about['__license__'],
     packages=find_packages(exclude=('tests*',)),
+    python_requires='>=3.8',
     install_requires=install_requires,
+    extras_require=extras_require,
     test_requires=test_requires,
     zip_safe=True,
 )
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+import unittest
+from unittest import mock
+
+from aioimap import filter as filter_module
+from aioimap.filter import AndFilter, OrFilter, SenderFilter, SubjectFilter
+
+
+def message(sender="alice@example.com", subject="Hello"):
+    return SimpleNamespace(
+        sender=sender, sender_ci=sender.casefold(),
+        subject=subject, subject_ci=subject.casefold())
+
+
+class NotSenderFilter(SenderFilter):
+
+    def __call__(self, msg):
+        return not super().__call__(msg)
+
+
+class FilterTest(unittest.TestCase):
+
+    def test_nested_subclass_call_is_used(self):
+        msg = message()
+
+        self.assertFalse(AndFilter([NotSenderFilter("alice")])(msg))
+        self.assertFalse(OrFilter([NotSenderFilter("alice")])(msg))
+        self.assertTrue(AndFilter([
+            NotSenderFilter("bob"), SubjectFilter("Hell")])(msg))
+
+    def test_compiled_attributes_are_read_only(self):
+        sender_filter = SenderFilter("alice")
+        subject_filter = SubjectFilter("Hello", case_insensitive=True)
+        and_filter = AndFilter([sender_filter])
+
+        with self.assertRaises(AttributeError):
+            sender_filter.sender = "bob"
+        with self.assertRaises(AttributeError):
+            subject_filter.case_insensitive = False
+        with self.assertRaises(AttributeError):
+            and_filter.filters = []
+        self.assertEqual(and_filter.filters, (sender_filter,))
+
+
+class OrFilterFoldTest(unittest.TestCase):
+
+    def assert_folded(self, make_filter):
+        # folded filters match with a single substring matcher
+        with mock.patch.object(
+            filter_module, "_substring_matcher",
+            wraps=filter_module._substring_matcher) as matcher:
+            or_filter = make_filter()
+        matcher.assert_called_once()
+        return or_filter
+
+    def check_senders(self):
+        or_filter = self.assert_folded(
+            lambda: OrFilter.from_sender_substrings(["bob", "alice"]))
+
+        self.assertTrue(or_filter(message(sender="alice@example.com")))
+        self.assertFalse(or_filter(message(sender="carol@example.com")))
+        # case-sensitive unless asked otherwise
+        self.assertFalse(or_filter(message(sender="Alice@example.com")))
+
+    def check_case_insensitive_subjects(self):
+        or_filter = self.assert_folded(
+            lambda: OrFilter.from_subject_substrings(
+                ["URGENT", "Straße"], case_insensitive=True))
+
+        self.assertTrue(or_filter(message(subject="urgent: read me")))
+        # casefold() also matches "ß" with "ss"
+        self.assertTrue(or_filter(message(subject="STRASSE closed")))
+        self.assertFalse(or_filter(message(subject="Hello")))
+
+    def test_fold_without_ahocorasick(self):
+        with mock.patch.object(filter_module, "ahocorasick", None):
+            self.check_senders()
+            self.check_case_insensitive_subjects()
+
+    @unittest.skipIf(filter_module.ahocorasick is None, "pyahocorasick not installed")
+    def test_fold_with_ahocorasick(self):
+        self.check_senders()
+        self.check_case_insensitive_subjects()
+
+    def test_empty_substring_matches_everything(self):
+        or_filter = OrFilter.from_subject_substrings(["", "never"])
+
+        self.assertTrue(or_filter(message(subject="Hello")))
+
+    def test_mixed_filters_not_folded(self):
+        with mock.patch.object(filter_module, "_substring_matcher") as matcher:
+            or_filter = OrFilter([
+                SenderFilter("bob"),
+                SenderFilter("ALICE", case_insensitive=True)])
+        matcher.assert_not_called()
+
+        self.assertTrue(or_filter(message(sender="alice@example.com")))
+        self.assertFalse(or_filter(message(sender="carol@example.com")))
+
+
+if __name__ == "__main__":
+    unittest.main()
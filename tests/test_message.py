@@ -0,0 +1,57 @@
+import unittest
+
+from aioimap.message import Message
+
+
+MULTIPART = (
+    b"From: alice@example.com\r\n"
+    b"Subject: =?utf-8?b?SGVsbG8gd8O2cmxk?=\r\n"
+    b"Content-Type: multipart/mixed; boundary=b\r\n"
+    b"\r\n"
+    b"--b\r\n"
+    b"Content-Type: text/plain\r\n\r\nfirst part\r\n"
+    b"--b\r\n"
+    b"Content-Type: text/html\r\n\r\n<p>html part</p>\r\n"
+    b"--b\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Disposition: attachment; filename=notes.txt\r\n"
+    b"\r\nattached text\r\n"
+    b"--b\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"Content-Transfer-Encoding: base64\r\n\r\nc2Vjb25kIHBhcnQ=\r\n"
+    b"--b--\r\n")
+
+
+class MessageTest(unittest.TestCase):
+
+    def test_body_parsed_lazily(self):
+        m = Message(MULTIPART, mailbox="INBOX")
+
+        self.assertEqual(m.subject, "Hello wörld")
+        self.assertEqual(m.sender, "alice@example.com")
+        self.assertEqual(m.mailbox, "INBOX")
+        # the headers are enough for the subject and sender
+        self.assertNotIn("msg", vars(m))
+
+        self.assertEqual(m.content, "first part second part")
+        self.assertIn("msg", vars(m))
+
+    def test_iter_content_skips_html_and_attachments(self):
+        m = Message(MULTIPART)
+
+        self.assertEqual(
+            list(m.iter_content()), ["first part", "second part"])
+        self.assertEqual(
+            list(m.iter_content(first_only=True)), ["first part"])
+
+    def test_iter_content_single_part(self):
+        m = Message(
+            b"From: bob@example.com\r\nSubject: Hi\r\n"
+            b"Content-Type: text/plain; charset=latin-1\r\n\r\ncaf\xe9")
+
+        self.assertEqual(list(m.iter_content()), ["café"])
+        self.assertEqual(m.content, "café")
+
+
+if __name__ == "__main__":
+    unittest.main()
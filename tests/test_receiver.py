@@ -0,0 +1,453 @@
+import asyncio
+from collections import namedtuple
+import unittest
+from unittest import mock
+
+from aioimap.receiver import ImapPool, Receiver, message_set
+
+
+Response = namedtuple("Response", "result lines")
+
+
+class StubProtocol(object):
+
+    def __init__(self, capabilities):
+        self.loop = asyncio.get_running_loop()
+        self.capabilities = set()
+        self.server_capabilities = set(capabilities)
+        self.commands = []
+        self.tags = 0
+        self.idle_queue = asyncio.Queue()
+
+    def new_tag(self):
+        self.tags += 1
+        return f"A{self.tags}"
+
+    async def capability(self):
+        self.commands.append("CAPABILITY")
+        self.capabilities = set(self.server_capabilities)
+
+    async def execute(self, command):
+        self.commands.append(command.name)
+        return Response("OK", [])
+
+
+class StubClient(object):
+    """
+    Stands in for `aioimaplib.IMAP4`, which only offers
+    `has_capability` and leaves CAPABILITY to the protocol.
+    """
+    timeout = 10
+
+    def __init__(self, capabilities, unseen=()):
+        self.protocol = StubProtocol(capabilities)
+        self.unseen = list(unseen)
+
+    def has_capability(self, capability):
+        return capability in self.protocol.capabilities
+
+    def has_pending_idle(self):
+        return False
+
+    async def idle_start(self, timeout=None):
+        raise AssertionError("IDLE not expected")
+
+    async def select(self, mailbox="INBOX"):
+        return Response("OK", [b"[UIDNEXT 100] Predicted next UID"])
+
+    async def search(self, *criteria, charset=None):
+        ids, self.unseen = self.unseen, []
+        return Response("OK", [" ".join(ids).encode(), b"SEARCH completed"])
+
+    async def fetch(self, message_set, fetch_spec):
+        lines = []
+        for id in message_set.split(","):
+            body = b"Subject: s%s\r\n\r\nbody" % id.encode()
+            lines += [
+                b"%s FETCH (RFC822 {%d}" % (id.encode(), len(body)),
+                bytearray(body), b")"]
+        return Response("OK", lines + [b"FETCH completed"])
+
+
+class IdleStubClient(StubClient):
+    """
+    Stub client that can IDLE; pushes are put on the idle queue.
+    """
+
+    def __init__(self, capabilities, unseen=()):
+        super().__init__(capabilities, unseen)
+        self.idling = False
+        self.idle_starts = 0
+        self.idle = None
+        self.uid_fetches = []
+
+    def has_pending_idle(self):
+        return self.idling
+
+    async def idle_start(self, timeout=None):
+        self.idling = True
+        self.idle_starts += 1
+        self.idle = asyncio.get_running_loop().create_future()
+        return self.idle
+
+    def idle_done(self):
+        self.idling = False
+        self.idle.set_result(Response("OK", []))
+
+    async def wait_server_push(self, timeout=None):
+        return await self.protocol.idle_queue.get()
+
+    async def uid(self, command, message_set, fetch_spec):
+        # like aioimaplib, hold the command back until IDLE ends
+        if self.idling:
+            await self.idle
+        self.uid_fetches.append(message_set)
+        body = b"Subject: s100\r\n\r\nbody"
+        return Response("OK", [
+            b"1 FETCH (UID 100 RFC822 {%d}" % len(body), bytearray(body),
+            b")", b"FETCH completed"])
+
+
+class UidStubClient(object):
+    """
+    Answers UID FETCH with the given response lines.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.commands = []
+
+    async def uid(self, command, message_set, fetch_spec):
+        self.commands.append((command, message_set, fetch_spec))
+        return Response("OK", self.lines + [b"FETCH completed"])
+
+
+class MessageSetTest(unittest.TestCase):
+
+    def test_consecutive_ids_collapsed(self):
+        self.assertEqual(
+            message_set(["1", "2", "3", "7", "9", "10"]), "1:3,7,9:10")
+
+    def test_single_ids_kept(self):
+        self.assertEqual(message_set(["4"]), "4")
+        self.assertEqual(message_set(["2", "4", "6"]), "2,4,6")
+
+    def test_no_ids(self):
+        self.assertEqual(message_set([]), "")
+
+
+class FetchNewTest(unittest.IsolatedAsyncioTestCase):
+
+    async def fetch_new(self, lines, uidnext=100):
+        self.receiver = Receiver()
+        self.receiver._uidnext = uidnext
+        self.client = UidStubClient(lines)
+        return await self.receiver.fetch_new(self.client)
+
+    async def test_uid_before_literal(self):
+        bodies = await self.fetch_new([
+            b"5 FETCH (UID 100 RFC822 {4}", bytearray(b"m100"), b")",
+            b"6 FETCH (UID 102 RFC822 {4}", bytearray(b"m102"), b")"])
+
+        self.assertEqual(bodies, [b"m100", b"m102"])
+        self.assertEqual(self.receiver._uidnext, 103)
+        self.assertEqual(
+            self.client.commands, [("fetch", "100:*", "(UID RFC822)")])
+
+    async def test_uid_after_literal(self):
+        bodies = await self.fetch_new([
+            b"5 FETCH (RFC822 {4}", bytearray(b"m100"), b" UID 100)",
+            b"6 FETCH (RFC822 {4}", bytearray(b"m101"), b" UID 101)"])
+
+        self.assertEqual(bodies, [b"m100", b"m101"])
+        self.assertEqual(self.receiver._uidnext, 102)
+
+    async def test_last_message_excluded(self):
+        # without new messages, "100:*" still returns the last one
+        bodies = await self.fetch_new([
+            b"4 FETCH (UID 99 RFC822 {3}", bytearray(b"m99"), b")"])
+
+        self.assertEqual(bodies, [])
+        self.assertEqual(self.receiver._uidnext, 100)
+
+
+class NotifyTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_notify_supported(self):
+        receiver = Receiver()
+        receiver.imap_client = StubClient({"IMAP4rev1", "IDLE", "NOTIFY"})
+
+        self.assertTrue(await receiver.notify(["Other box"]))
+        self.assertEqual(
+            receiver.imap_client.protocol.commands, ["CAPABILITY", "NOTIFY"])
+
+    async def test_notify_not_supported(self):
+        receiver = Receiver()
+        receiver.imap_client = StubClient({"IMAP4rev1", "IDLE"})
+
+        self.assertFalse(await receiver.notify(["Other box"]))
+        self.assertEqual(
+            receiver.imap_client.protocol.commands, ["CAPABILITY"])
+
+
+class WaitForNewMessageTest(unittest.IsolatedAsyncioTestCase):
+
+    async def start(
+        self, execute=None, client=None, mailbox=("INBOX", "Other box"),
+    ):
+        self.received = []
+        self.receiver = Receiver()
+        self.receiver.imap_client_lock = asyncio.Lock()
+        self.receiver._idle_interrupt = asyncio.Event()
+        self.receiver._callback_slots = asyncio.Semaphore(10)
+        self.receiver.should_exit = asyncio.Event()
+        self.receiver._callback_is_coro = True
+        self.receiver.imap_client = client or StubClient(
+            {"IMAP4rev1", "IDLE", "NOTIFY"}, unseen=["1", "3"])
+        if execute is not None:
+            self.receiver.imap_client.protocol.execute = execute
+
+        async def callback(m):
+            self.received.append(m.subject)
+
+        return asyncio.create_task(self.receiver.wait_for_new_message(
+            callback, list(mailbox)))
+
+    async def wait_callbacks(self):
+        if self.receiver._pending_callbacks:
+            await asyncio.wait(self.receiver._pending_callbacks)
+
+    async def test_fetched_messages_dispatched_on_error(self):
+        async def execute(command):
+            raise RuntimeError("NOTIFY failed")
+
+        task = await self.start(execute)
+        with self.assertRaises(RuntimeError):
+            await task
+        await self.wait_callbacks()
+
+        self.assertEqual(sorted(self.received), ["s1", "s3"])
+
+    async def test_fetched_messages_dispatched_on_cancel(self):
+        async def execute(command):
+            await asyncio.Event().wait()
+
+        task = await self.start(execute)
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        await self.wait_callbacks()
+
+        self.assertEqual(sorted(self.received), ["s1", "s3"])
+
+    async def test_work_client_dropped_while_waiting_for_lock(self):
+        client = IdleStubClient({"IMAP4rev1", "IDLE"})
+        pool = ImapPool("host", "user", "password")
+        pool.work_client = StubWorkClient()
+
+        task = await self.start(client=client, mailbox=["INBOX"])
+        self.receiver.pool = pool
+        await asyncio.sleep(0.05)
+
+        # keepalive holds the lock and drops the work client
+        async with pool.work_client_lock:
+            client.protocol.idle_queue.put_nowait([b"1 EXISTS"])
+            await asyncio.sleep(0.1)
+            pool.drop()
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.wait((task,))
+        await self.wait_callbacks()
+
+        # fetched with the IDLE client after ending IDLE
+        self.assertEqual(client.uid_fetches, ["100:*"])
+        self.assertEqual(self.received, ["s100"])
+
+    async def test_idle_restarted_after_leftover_push(self):
+        # a push that arrived after DONE, before IDLE completed
+        client = IdleStubClient({"IMAP4rev1", "IDLE"})
+        client.protocol.idle_queue.put_nowait([b"2 FETCH (FLAGS (\\Seen))"])
+
+        task = await self.start(client=client, mailbox=["INBOX"])
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.wait((task,))
+
+        self.assertEqual(client.idle_starts, 1)
+        self.assertTrue(client.protocol.idle_queue.empty())
+
+    async def test_idle_done_not_completed(self):
+        client = IdleStubClient({"IMAP4rev1", "IDLE"})
+        # the server never completes IDLE after DONE
+        client.idle_done = lambda: None
+
+        with mock.patch("aioimap.receiver.IDLE_DONE_TIMEOUT", 0.1):
+            task = await self.start(client=client, mailbox=["INBOX"])
+            await asyncio.sleep(0.05)
+            client.protocol.idle_queue.put_nowait([b"1 EXISTS"])
+            await asyncio.wait((task,), timeout=1)
+
+        self.assertTrue(task.done())
+        self.assertIsInstance(task.exception(), asyncio.TimeoutError)
+        self.assertEqual(client.uid_fetches, [])
+
+
+class StubTransport(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class StubWorkClient(object):
+
+    def __init__(self, fail=False):
+        self.protocol = type("Protocol", (), {})()
+        self.protocol.transport = StubTransport()
+        self.protocol.state = "SELECTED"
+        self.fail = fail
+        self.commands = []
+
+    async def noop(self):
+        self.commands.append("NOOP")
+        if self.fail:
+            raise TimeoutError()
+        return Response("OK", [])
+
+    async def select(self, mailbox="INBOX"):
+        self.commands.append(f"SELECT {mailbox}")
+        if self.fail:
+            raise TimeoutError()
+        return Response("OK", [])
+
+
+class StubPool(ImapPool):
+
+    async def _connect(self):
+        self.work_client = StubWorkClient()
+        self.connects += 1
+
+
+class ImapPoolTest(unittest.IsolatedAsyncioTestCase):
+
+    def make_pool(self, work_client):
+        pool = StubPool("host", "user", "password", keepalive_interval=0)
+        pool.connects = 0
+        pool.work_client = work_client
+        return pool
+
+    async def test_keepalive_reconnects_lost_work_client(self):
+        lost = StubWorkClient(fail=True)
+        pool = self.make_pool(lost)
+
+        task = asyncio.create_task(pool.keepalive())
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+        self.assertTrue(lost.protocol.transport.closed)
+        self.assertEqual(pool.connects, 1)
+        self.assertIsNot(pool.work_client, lost)
+        self.assertTrue(pool.usable())
+
+    async def test_failed_select_drops_work_client(self):
+        lost = StubWorkClient(fail=True)
+        pool = self.make_pool(lost)
+
+        await pool.select("INBOX")
+
+        self.assertTrue(lost.protocol.transport.closed)
+        self.assertFalse(pool.usable())
+        # selected again once the work client reconnects
+        self.assertEqual(pool.mailbox, "INBOX")
+
+
+class RunTest(unittest.TestCase):
+
+    def test_run_on_another_loop_than_construction(self):
+        class UnreachableReceiver(Receiver):
+            __slots__ = ("attempts",)
+
+            async def connect(self, host, port=993, timeout=10):
+                self.attempts += 1
+                self.imap_client = StubClient(set())
+                self.imap_client.host = host
+                self.imap_client.port = port
+                raise OSError("unreachable")
+
+        # constructed before any event loop runs, as in
+        # asyncio.run(Receiver().run(...))
+        receiver = UnreachableReceiver()
+        receiver.attempts = 0
+
+        async def main():
+            asyncio.get_running_loop().call_later(
+                0.5, receiver.handle_exit, None, None)
+            await receiver.run(
+                "host", "user", "password", lambda m: None,
+                install_signal_handlers=False)
+
+        asyncio.run(asyncio.wait_for(main(), 5))
+
+        self.assertTrue(receiver.exit_event.is_set())
+        # waiting between attempts works on the loop run() runs on
+        self.assertLess(receiver.attempts, 5)
+
+
+class IdleReceiver(Receiver):
+    __slots__ = ("clients",)
+
+    async def connect(self, host, port=993, timeout=10):
+        client = IdleStubClient({"IMAP4rev1", "IDLE"})
+        client.host, client.port = host, port
+        # logged in already, like a spare connection
+        client.protocol.state = "SELECTED"
+        self.clients.append(client)
+        self.set_client(client)
+
+
+class RunCancelTest(unittest.IsolatedAsyncioTestCase):
+
+    async def start(self):
+        self.receiver = IdleReceiver()
+        self.receiver.clients = []
+        task = asyncio.create_task(self.receiver.run(
+            "host", "user", "password", lambda m: None,
+            install_signal_handlers=False))
+        await asyncio.sleep(0.1)
+        return task
+
+    async def stop(self, task):
+        task.cancel()
+        await asyncio.wait((task,), timeout=1)
+        if not task.done():
+            # stop it anyway, so the test fails instead of hanging
+            self.receiver.handle_exit(None, None)
+            await asyncio.wait((task,), timeout=1)
+
+    async def test_cancel_run(self):
+        task = await self.start()
+
+        await self.stop(task)
+
+        self.assertTrue(task.cancelled())
+
+    async def test_reconnect_keeps_running(self):
+        task = await self.start()
+
+        await self.receiver.reconnect()
+        await asyncio.sleep(0.1)
+
+        self.assertFalse(task.done())
+        self.assertEqual(len(self.receiver.clients), 2)
+        self.assertEqual(self.receiver.clients[1].idle_starts, 1)
+        await self.stop(task)
+
+
+if __name__ == "__main__":
+    unittest.main()